@@ -1,17 +1,21 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
+import asyncio
+import anyio
 import logging
 import os
-import json
-from pathlib import Path
+import queue
+from typing import Optional
+from logging.handlers import QueueHandler, QueueListener
 
 from app.routers import postgresql, mongodb
-from app.utils.pool import postgresql_pool, mongodb_pool
+from app.utils.pool import postgresql_pool, mongodb_pool, POSTGRESQL_POOL_MAX_CONN
 from app.utils.concurrency import ConcurrencyLimiterMiddleware
 from app.utils.error_handler import setup_error_handlers
-from app.utils.auth import initialize_auth
-from app.utils.auth_middleware import AuthMiddleware
+from app.utils.response import APIResponse
+from app.utils.auth import initialize_auth, get_access_token
+from app.utils.auth_middleware import authenticate
 
 # 配置日志
 logging.basicConfig(
@@ -20,6 +24,30 @@ logging.basicConfig(
 )
 logger = logging.getLogger("database-api")
 
+# 应用运行期间日志记录先放入队列，由后台线程写出，请求处理中不再等待输出和处理器锁
+# 启动前和关闭后没有监听线程，日志仍由原处理器直接写出
+log_queue = queue.SimpleQueue()
+log_listener: Optional[QueueListener] = None
+
+def start_queue_logging():
+    """把根日志器的处理器换成队列处理器，并启动写出日志的监听线程；已启动时不重复启动"""
+    global log_listener
+    if log_listener is not None:
+        return
+    root_logger = logging.getLogger()
+    log_listener = QueueListener(log_queue, *root_logger.handlers, respect_handler_level=True)
+    log_listener.start()
+    root_logger.handlers = [QueueHandler(log_queue)]
+
+def stop_queue_logging():
+    """恢复根日志器的原处理器，写出队列中剩余的日志后停止监听线程"""
+    global log_listener
+    if log_listener is None:
+        return
+    logging.getLogger().handlers = list(log_listener.handlers)
+    log_listener.stop()
+    log_listener = None
+
 # 初始化认证系统
 initialize_auth()
 
@@ -28,6 +56,8 @@ app = FastAPI(
     title="数据库API服务",
     description="用于连接并操作PostgreSQL和MongoDB数据库的API服务",
     version="1.0.0",
+    # 所有接口默认使用orjson序列化响应
+    default_response_class=APIResponse,
 )
 
 # 添加CORS中间件
@@ -44,18 +74,23 @@ max_concurrent_requests = int(os.environ.get("MAX_CONCURRENT_REQUESTS", 200))
 postgresql_max_concurrent = int(os.environ.get("POSTGRESQL_MAX_CONCURRENT", 100))
 mongodb_max_concurrent = int(os.environ.get("MONGODB_MAX_CONCURRENT", 100))
 
-# 添加并发控制中间件
+# 添加并发控制中间件，身份验证在同一个中间件中先行完成
 app.add_middleware(
     ConcurrencyLimiterMiddleware,
     max_concurrent_requests=max_concurrent_requests,
     postgresql_max_concurrent=postgresql_max_concurrent,
     mongodb_max_concurrent=mongodb_max_concurrent,
+    authenticate=authenticate,
 )
 
-# 添加身份验证中间件
-app.add_middleware(AuthMiddleware)
+logger.info("配置并发控制: 总并发=%d, PostgreSQL=%d, MongoDB=%d", max_concurrent_requests, postgresql_max_concurrent, mongodb_max_concurrent)
 
-logger.info(f"配置并发控制: 总并发={max_concurrent_requests}, PostgreSQL={postgresql_max_concurrent}, MongoDB={mongodb_max_concurrent}")
+# 单个连接池的最大连接数小于PostgreSQL并发上限时，访问同一数据库的请求会在连接池上排队等待
+if POSTGRESQL_POOL_MAX_CONN < postgresql_max_concurrent:
+    logger.warning(
+        "PostgreSQL连接池最大连接数(%d)小于PostgreSQL并发上限(%d)，访问同一数据库的并发请求超出连接数时需要等待可用连接",
+        POSTGRESQL_POOL_MAX_CONN, postgresql_max_concurrent
+    )
 
 # 注册路由
 app.include_router(postgresql.router, prefix="/apiDatabase")
@@ -72,38 +107,41 @@ async def root():
 async def get_token():
     """获取当前配置的访问令牌"""
     try:
-        # 读取配置文件中的令牌
-        base_dir = Path(os.path.dirname(os.path.abspath(__file__))).parent
-        config_file = base_dir / "config" / "access_token.json"
-        
-        if not config_file.exists():
-            return {"error": "配置文件不存在"}
-            
-        with open(config_file, "r") as f:
-            config = json.load(f)
-            token = config.get("accessToken")
+        # 与身份验证中间件使用同一个令牌
+        token = get_access_token()
             
         if not token:
             return {"error": "未找到有效的访问令牌"}
             
         return {"accessToken": token}
     except Exception as e:
-        logger.error(f"获取令牌时出错: {str(e)}")
+        logger.error("获取令牌时出错: %s", e)
         return {"error": f"获取令牌失败: {str(e)}"}
 
 @app.on_event("startup")
 async def startup_event():
     """应用启动时执行的事件，初始化连接池"""
+    start_queue_logging()
     logger.info("数据库API服务启动，初始化连接池")
-    # 连接池已在模块导入时初始化
+    # 连接池已在模块导入时初始化，在事件循环上开始定时清理闲置连接池
+    loop = asyncio.get_running_loop()
+    postgresql_pool.start_cleanup(loop)
+    mongodb_pool.start_cleanup(loop)
+    
+    # 同步的数据库路由在线程池中执行，线程数不能低于数据库并发上限，否则线程池会先于并发控制成为瓶颈
+    thread_limiter = anyio.to_thread.current_default_thread_limiter()
+    thread_limiter.total_tokens = max(thread_limiter.total_tokens, postgresql_max_concurrent + mongodb_max_concurrent)
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """应用关闭时执行的事件，清理资源"""
     logger.info("数据库API服务关闭，清理资源")
-    # 连接池会自动清理
+    postgresql_pool.stop_cleanup()
+    mongodb_pool.stop_cleanup()
+    stop_queue_logging()
 
 if __name__ == "__main__":
     # 获取端口，默认3010
     port = int(os.environ.get("PORT", 3010))
-    uvicorn.run("app.main:app", host="0.0.0.0", port=port, reload=True) 
\ No newline at end of file
+    # 设置DEV环境变量时才开启代码热重载，避免生产环境额外运行文件监控
+    uvicorn.run("app.main:app", host="0.0.0.0", port=port, reload=bool(os.environ.get("DEV"))) 
\ No newline at end of file
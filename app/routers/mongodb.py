@@ -2,17 +2,31 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field, validator
 from typing import Dict, Any, List, Optional, Union
 import logging
-import json
+import threading
+import time
+import orjson
 from bson import json_util, ObjectId
 import pymongo
+from pymongo import InsertOne, UpdateOne, UpdateMany, DeleteOne, DeleteMany
 from pymongo.errors import PyMongoError
 import re
-from app.utils.response import success_response, error_response
+from app.utils.response import APIResponse, success_response, error_response
 from app.utils.pool import mongodb_pool
 
 router = APIRouter(tags=["MongoDB"])
 logger = logging.getLogger("database-api")
 
+# 批量接口支持的写操作
+BULK_OPERATIONS = ('insert', 'update', 'updatemany', 'delete', 'deletemany')
+
+# 集合存在性检查结果缓存，键为(host, port, database, username, collection)，值为过期时间
+# 与客户端连接池一样按用户名区分，一个用户看到的集合不会被当作另一个用户也能访问
+# 只缓存“集合存在”的结果，新建的集合在下一次请求时即可见
+COLLECTION_CACHE_TTL = 30
+COLLECTION_CACHE_MAX_SIZE = 1024
+_collection_cache: Dict[tuple, float] = {}
+_collection_cache_lock = threading.Lock()
+
 class MongoDBConnectionInfo(BaseModel):
     host: str
     port: int = 27017
@@ -70,22 +84,272 @@ class MongoDBExecuteRequest(BaseModel):
         
         return v.lower()
 
-# 将MongoDB的BSON对象转换为JSON可序列化的格式
-def parse_json(data):
-    return json.loads(json_util.dumps(data))
+class MongoDBBulkOperation(BaseModel):
+    operation: str
+    filter: Optional[Dict[str, Any]] = None
+    update: Optional[Dict[str, Any]] = None
+    document: Optional[Dict[str, Any]] = None
+
+    @validator('operation')
+    def validate_operation(cls, v):
+        if not v or not v.strip():
+            raise ValueError("MongoDB操作类型不能为空")
+        
+        if v.lower() not in BULK_OPERATIONS:
+            raise ValueError(f"批量操作不支持的操作类型: {v}。支持的操作类型有: {', '.join(BULK_OPERATIONS)}")
+        
+        return v.lower()
+
+class MongoDBBulkRequest(BaseModel):
+    connection: MongoDBConnectionInfo
+    collection: str
+    operations: List[MongoDBBulkOperation]
+    ordered: bool = True
 
-@router.post("/mongodb")
-async def execute_mongodb(request: MongoDBExecuteRequest):
+    @validator('collection')
+    def validate_collection(cls, v):
+        if not v or not v.strip():
+            raise ValueError("MongoDB集合名不能为空")
+        return v
+
+    @validator('operations')
+    def validate_operations(cls, v):
+        if not v:
+            raise ValueError("operations不能为空，请提供要执行的操作列表")
+        return v
+
+class MongoDBResponse(APIResponse):
+    """
+    MongoDB操作的响应
+    
+    BSON特有类型（ObjectId、datetime、Decimal128等）交由bson.json_util.default转换，
+    输出与bson.json_util.dumps的扩展JSON格式一致，无需先转成JSON字符串再解析回来
+    """
+    
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=json_util.default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+# 各操作的处理函数，参数已在调用前完成验证
+# 查询操作
+def _find(collection, request: MongoDBExecuteRequest) -> Dict[str, Any]:
+    filter_dict = request.filter or {}
+    projection_dict = request.projection or None
+    cursor = collection.find(filter_dict, projection_dict)
+    
+    # 应用排序、跳过和限制
+    if request.sort:
+        cursor = cursor.sort(request.sort)
+    if request.skip:
+        cursor = cursor.skip(request.skip)
+    if request.limit:
+        cursor = cursor.limit(request.limit)
+        
+    # 获取结果
+    results = list(cursor)
+    
+    # 检查结果是否为空
+    if not results:
+        logger.debug("查询未返回任何结果: %s", filter_dict)
+    
+    return success_response(results)
+
+def _find_one(collection, request: MongoDBExecuteRequest) -> Dict[str, Any]:
+    filter_dict = request.filter or {}
+    projection_dict = request.projection or None
+    result = collection.find_one(filter_dict, projection_dict)
+    
+    if result:
+        return success_response([result])
+    else:
+        logger.debug("查询未返回任何结果: %s", filter_dict)
+        return success_response([])
+
+# 插入操作
+def _insert(collection, request: MongoDBExecuteRequest) -> Dict[str, Any]:
+    result = collection.insert_one(request.document)
+    logger.debug("成功插入文档，ID: %s", result.inserted_id)
+    return success_response(1)
+
+def _insert_many(collection, request: MongoDBExecuteRequest) -> Dict[str, Any]:
+    result = collection.insert_many(request.documents)
+    logger.debug("成功插入%d个文档", len(result.inserted_ids))
+    return success_response(len(result.inserted_ids))
+
+# 更新操作
+def _update(collection, request: MongoDBExecuteRequest) -> Dict[str, Any]:
+    result = collection.update_one(request.filter, request.update)
+    
+    if result.modified_count == 0:
+        logger.debug("更新操作未影响任何文档: %s", request.filter)
+    else:
+        logger.debug("成功更新%d个文档", result.modified_count)
+    
+    return success_response(result.modified_count)
+
+def _update_many(collection, request: MongoDBExecuteRequest) -> Dict[str, Any]:
+    result = collection.update_many(request.filter, request.update)
+    
+    if result.modified_count == 0:
+        logger.debug("批量更新操作未影响任何文档: %s", request.filter)
+    else:
+        logger.debug("成功更新%d个文档", result.modified_count)
+    
+    return success_response(result.modified_count)
+
+# 删除操作
+def _delete(collection, request: MongoDBExecuteRequest) -> Dict[str, Any]:
+    result = collection.delete_one(request.filter)
+    
+    if result.deleted_count == 0:
+        logger.debug("删除操作未影响任何文档: %s", request.filter)
+    else:
+        logger.debug("成功删除%d个文档", result.deleted_count)
+    
+    return success_response(result.deleted_count)
+
+def _delete_many(collection, request: MongoDBExecuteRequest) -> Dict[str, Any]:
+    result = collection.delete_many(request.filter)
+    
+    if result.deleted_count == 0:
+        logger.debug("批量删除操作未影响任何文档: %s", request.filter)
+    else:
+        logger.debug("成功删除%d个文档", result.deleted_count)
+    
+    return success_response(result.deleted_count)
+
+# 聚合操作
+def _aggregate(collection, request: MongoDBExecuteRequest) -> Dict[str, Any]:
+    try:
+        results = list(collection.aggregate(request.pipeline))
+        
+        if not results:
+            logger.debug("聚合操作未返回任何结果")
+        
+        return success_response(results)
+    except pymongo.errors.OperationFailure as e:
+        error_msg = str(e)
+        
+        if "pipeline" in error_msg:
+            error_msg = f"聚合管道格式错误: {error_msg}"
+        elif "unknown operator" in error_msg:
+            match = re.search(r'unknown operator: ([^\s]+)', error_msg)
+            if match:
+                op = match.group(1)
+                error_msg = f"聚合管道中使用了未知操作符: {op}"
+        elif "accumulator" in error_msg:
+            error_msg = f"聚合累加器错误: {error_msg}"
+        
+        logger.error("聚合操作失败: %s", error_msg)
+        return error_response(1108, f"聚合操作失败: {error_msg}")
+
+# 计数操作
+def _count(collection, request: MongoDBExecuteRequest) -> Dict[str, Any]:
+    filter_dict = request.filter or {}
+    count = collection.count_documents(filter_dict)
+    return success_response(count)
+
+# 操作类型到处理函数的映射，模块加载时构建一次
+OPERATION_HANDLERS = {
+    "find": _find,
+    "findone": _find_one,
+    "insert": _insert,
+    "insertmany": _insert_many,
+    "update": _update,
+    "updatemany": _update_many,
+    "delete": _delete,
+    "deletemany": _delete_many,
+    "aggregate": _aggregate,
+    "count": _count,
+}
+
+def _collection_cached(cache_key: tuple) -> bool:
+    """集合最近已确认存在且缓存未过期"""
+    expires_at = _collection_cache.get(cache_key)
+    return expires_at is not None and expires_at > time.monotonic()
+
+def _cache_collection(cache_key: tuple):
+    """记录集合存在，缓存已满时先清理过期条目，仍然满则整体清空"""
+    with _collection_cache_lock:
+        now = time.monotonic()
+        if len(_collection_cache) >= COLLECTION_CACHE_MAX_SIZE:
+            for key in [key for key, expires_at in _collection_cache.items() if expires_at <= now]:
+                del _collection_cache[key]
+            if len(_collection_cache) >= COLLECTION_CACHE_MAX_SIZE:
+                _collection_cache.clear()
+        _collection_cache[cache_key] = now + COLLECTION_CACHE_TTL
+
+def _get_collection(request: Union[MongoDBExecuteRequest, MongoDBBulkRequest]):
+    """
+    从连接池获取客户端并检查集合是否存在
+    
+    Returns:
+        (集合对象, None) 或 (None, 错误响应字典)
+    """
+    # 从连接池获取MongoDB客户端
+    client, error = mongodb_pool.get_client(
+        host=request.connection.host,
+        port=request.connection.port,
+        database=request.connection.database, 
+        username=request.connection.username,
+        password=request.connection.password,
+        auth_source=request.connection.auth_source,
+        connect_timeout_ms=request.connection.connect_timeout_ms
+    )
+    
+    if error:
+        logger.error("从连接池获取MongoDB客户端失败: %s", error)
+        error_msg = error
+        # 提供更友好的连接错误消息
+        if "timed out" in error_msg:
+            error_msg = f"连接MongoDB服务器超时，请检查主机地址和端口是否正确: {request.connection.host}:{request.connection.port}"
+        elif "not authorized" in error_msg:
+            error_msg = "MongoDB认证失败，请检查用户名和密码是否正确"
+        elif "Authentication failed" in error_msg:
+            error_msg = "MongoDB认证失败，请检查用户名和密码是否正确"
+        
+        return None, error_response(1001, f"数据库连接错误: {error_msg}")
+        
+    logger.debug("成功从连接池获取MongoDB客户端: %s:%s/%s", request.connection.host, request.connection.port, request.connection.database)
+    
+    # 获取数据库和集合
+    db = client[request.connection.database]
+    
+    connection = request.connection
+    username = connection.username if connection.username and connection.password else None
+    cache_key = (connection.host, connection.port, connection.database, username, request.collection)
+    if _collection_cached(cache_key):
+        return db[request.collection], None
+    
+    try:
+        # 先检查集合是否存在，只让服务器返回目标集合名，避免在集合很多的库上传回完整列表
+        collection_exists = bool(db.list_collection_names(filter={"name": request.collection}))
+        if not collection_exists:
+            logger.warning("集合不存在: %s", request.collection)
+            # 所有操作在集合不存在时都返回错误信息
+            return None, error_response(1120, f"集合 '{request.collection}' 不存在")
+        
+        _cache_collection(cache_key)
+        return db[request.collection], None
+    except Exception as e:
+        logger.error("获取集合失败: %s", e)
+        return None, error_response(1002, f"获取集合 {request.collection} 失败，请检查集合名是否正确")
+
+# pymongo是同步驱动，路由定义为普通函数，由FastAPI放到线程池中执行，数据库往返期间不阻塞事件循环
+@router.post("/mongodb", response_class=MongoDBResponse)
+def execute_mongodb(request: MongoDBExecuteRequest):
     """
     执行MongoDB原生操作
     
     - 支持find, findOne, insert, insertMany, update, updateMany, delete, deleteMany等操作
     - 返回查询结果或操作影响的文档数量
     """
-    client = None
+    return MongoDBResponse(_execute_mongodb(request))
+
+def _execute_mongodb(request: MongoDBExecuteRequest) -> Dict[str, Any]:
+    """执行MongoDB操作，返回统一格式的响应字典"""
     try:
-        # 验证操作特定的参数
-        operation = request.operation.lower()
+        # 验证操作特定的参数（operation已由模型验证器转为小写）
+        operation = request.operation
         
         # 验证查询操作所需参数
         if operation in ["find", "findone"]:
@@ -118,181 +382,22 @@ async def execute_mongodb(request: MongoDBExecuteRequest):
         if operation == "aggregate" and not request.pipeline:
             return error_response(1107, "聚合操作缺少pipeline字段，请提供聚合管道")
         
-        # 从连接池获取MongoDB客户端
-        client, error = mongodb_pool.get_client(
-            host=request.connection.host,
-            port=request.connection.port,
-            database=request.connection.database, 
-            username=request.connection.username,
-            password=request.connection.password,
-            auth_source=request.connection.auth_source,
-            connect_timeout_ms=request.connection.connect_timeout_ms
-        )
-        
+        # 从连接池获取客户端并确认集合存在
+        collection, error = _get_collection(request)
         if error:
-            logger.error(f"从连接池获取MongoDB客户端失败: {error}")
-            error_msg = error
-            # 提供更友好的连接错误消息
-            if "timed out" in error_msg:
-                error_msg = f"连接MongoDB服务器超时，请检查主机地址和端口是否正确: {request.connection.host}:{request.connection.port}"
-            elif "not authorized" in error_msg:
-                error_msg = "MongoDB认证失败，请检查用户名和密码是否正确"
-            elif "Authentication failed" in error_msg:
-                error_msg = "MongoDB认证失败，请检查用户名和密码是否正确"
-            
-            return error_response(1001, f"数据库连接错误: {error_msg}")
-            
-        logger.info(f"成功从连接池获取MongoDB客户端: {request.connection.host}:{request.connection.port}/{request.connection.database}")
-        
-        # 获取数据库和集合
-        db = client[request.connection.database]
-        
-        try:
-            # 先检查集合是否存在
-            collection_exists = request.collection in db.list_collection_names()
-            if not collection_exists:
-                logger.warning(f"集合不存在: {request.collection}")
-                # 所有操作在集合不存在时都返回错误信息
-                return error_response(1120, f"集合 '{request.collection}' 不存在")
-                
-            collection = db[request.collection]
-        except Exception as e:
-            logger.error(f"获取集合失败: {str(e)}")
-            return error_response(1002, f"获取集合 {request.collection} 失败，请检查集合名是否正确")
+            return error
         
         # 执行操作
         try:
-            # 查询操作
-            if operation == "find":
-                filter_dict = request.filter or {}
-                projection_dict = request.projection or None
-                cursor = collection.find(filter_dict, projection_dict)
-                
-                # 应用排序、跳过和限制
-                if request.sort:
-                    cursor = cursor.sort(request.sort)
-                if request.skip:
-                    cursor = cursor.skip(request.skip)
-                if request.limit:
-                    cursor = cursor.limit(request.limit)
-                    
-                # 获取结果并转换为JSON
-                results = list(cursor)
-                
-                # 检查结果是否为空
-                if not results:
-                    logger.info(f"查询未返回任何结果: {filter_dict}")
-                
-                return success_response(parse_json(results))
-                
-            elif operation == "findone":
-                filter_dict = request.filter or {}
-                projection_dict = request.projection or None
-                result = collection.find_one(filter_dict, projection_dict)
-                
-                if result:
-                    return success_response([parse_json(result)])
-                else:
-                    logger.info(f"查询未返回任何结果: {filter_dict}")
-                    return success_response([])
-            
-            # 插入操作
-            elif operation == "insert":
-                # 已在前面验证document存在
-                result = collection.insert_one(request.document)
-                logger.info(f"成功插入文档，ID: {result.inserted_id}")
-                return success_response(1)
-                
-            elif operation == "insertmany":
-                # 已在前面验证documents存在
-                result = collection.insert_many(request.documents)
-                logger.info(f"成功插入{len(result.inserted_ids)}个文档")
-                return success_response(len(result.inserted_ids))
-            
-            # 更新操作
-            elif operation == "update":
-                # 已在前面验证filter和update存在
-                result = collection.update_one(request.filter, request.update)
-                
-                if result.modified_count == 0:
-                    logger.info(f"更新操作未影响任何文档: {request.filter}")
-                else:
-                    logger.info(f"成功更新{result.modified_count}个文档")
-                
-                return success_response(result.modified_count)
-                
-            elif operation == "updatemany":
-                # 已在前面验证filter和update存在
-                result = collection.update_many(request.filter, request.update)
-                
-                if result.modified_count == 0:
-                    logger.info(f"批量更新操作未影响任何文档: {request.filter}")
-                else:
-                    logger.info(f"成功更新{result.modified_count}个文档")
-                
-                return success_response(result.modified_count)
-            
-            # 删除操作
-            elif operation == "delete":
-                # 已在前面验证filter存在
-                result = collection.delete_one(request.filter)
-                
-                if result.deleted_count == 0:
-                    logger.info(f"删除操作未影响任何文档: {request.filter}")
-                else:
-                    logger.info(f"成功删除{result.deleted_count}个文档")
-                
-                return success_response(result.deleted_count)
-                
-            elif operation == "deletemany":
-                # 已在前面验证filter存在
-                result = collection.delete_many(request.filter)
-                
-                if result.deleted_count == 0:
-                    logger.info(f"批量删除操作未影响任何文档: {request.filter}")
-                else:
-                    logger.info(f"成功删除{result.deleted_count}个文档")
-                
-                return success_response(result.deleted_count)
-                
-            # 聚合操作
-            elif operation == "aggregate":
-                # 已在前面验证pipeline存在
-                try:
-                    results = list(collection.aggregate(request.pipeline))
-                    
-                    if not results:
-                        logger.info("聚合操作未返回任何结果")
-                    
-                    return success_response(parse_json(results))
-                except pymongo.errors.OperationFailure as e:
-                    error_msg = str(e)
-                    
-                    if "pipeline" in error_msg:
-                        error_msg = f"聚合管道格式错误: {error_msg}"
-                    elif "unknown operator" in error_msg:
-                        match = re.search(r'unknown operator: ([^\s]+)', error_msg)
-                        if match:
-                            op = match.group(1)
-                            error_msg = f"聚合管道中使用了未知操作符: {op}"
-                    elif "accumulator" in error_msg:
-                        error_msg = f"聚合累加器错误: {error_msg}"
-                    
-                    logger.error(f"聚合操作失败: {error_msg}")
-                    return error_response(1108, f"聚合操作失败: {error_msg}")
-                
-            # 计数操作
-            elif operation == "count":
-                filter_dict = request.filter or {}
-                count = collection.count_documents(filter_dict)
-                return success_response(count)
-            
-            else:
+            handler = OPERATION_HANDLERS.get(operation)
+            if handler is None:
                 # 虽然前面已验证，但保留兜底处理
                 return error_response(1109, f"不支持的操作类型: {request.operation}")
+            
+            return handler(collection, request)
                 
         except pymongo.errors.DuplicateKeyError as e:
-            logger.error(f"MongoDB插入重复键错误: {str(e)}")
+            logger.error("MongoDB插入重复键错误: %s", e)
             # 尝试提取重复键的字段名
             error_msg = str(e)
             match = re.search(r'duplicate key error .* key: \{ ([^:]+)', error_msg)
@@ -300,30 +405,30 @@ async def execute_mongodb(request: MongoDBExecuteRequest):
             return error_response(1110, f"插入操作失败，文档中的 {field} 与已有文档重复")
             
         except pymongo.errors.BulkWriteError as e:
-            logger.error(f"MongoDB批量写入错误: {str(e)}")
+            logger.error("MongoDB批量写入错误: %s", e)
             return error_response(1111, f"批量操作失败: {str(e)}")
             
         except pymongo.errors.WriteError as e:
-            logger.error(f"MongoDB写入错误: {str(e)}")
+            logger.error("MongoDB写入错误: %s", e)
             return error_response(1112, f"写入操作失败: {str(e)}")
             
         except pymongo.errors.InvalidOperation as e:
-            logger.error(f"MongoDB无效操作: {str(e)}")
+            logger.error("MongoDB无效操作: %s", e)
             error_msg = str(e)
             if "cannot use an empty filter" in error_msg:
                 error_msg = "不能使用空的过滤条件，请提供查询条件"
             return error_response(1113, f"无效操作: {error_msg}")
             
         except pymongo.errors.DocumentTooLarge as e:
-            logger.error(f"MongoDB文档过大: {str(e)}")
+            logger.error("MongoDB文档过大: %s", e)
             return error_response(1114, "文档大小超过MongoDB限制")
             
         except Exception as e:
-            logger.error(f"MongoDB操作执行错误: {str(e)}")
+            logger.error("MongoDB操作执行错误: %s", e)
             return error_response(1115, f"操作执行错误: {str(e)}")
                 
     except pymongo.errors.OperationFailure as e:
-        logger.error(f"MongoDB操作失败: {str(e)}")
+        logger.error("MongoDB操作失败: %s", e)
         error_msg = str(e)
         
         if "authentication failed" in error_msg.lower():
@@ -334,18 +439,101 @@ async def execute_mongodb(request: MongoDBExecuteRequest):
         return error_response(1002, f"数据库操作错误: {error_msg}")
         
     except PyMongoError as e:
-        logger.error(f"MongoDB错误: {str(e)}")
+        logger.error("MongoDB错误: %s", e)
         return error_response(1000, f"数据库错误: {str(e)}")
         
     except ValueError as e:
-        logger.error(f"参数验证错误: {str(e)}")
+        logger.error("参数验证错误: %s", e)
         return error_response(1116, f"参数验证错误: {str(e)}")
         
     except Exception as e:
-        logger.error(f"未预期的错误: {str(e)}")
+        logger.error("未预期的错误: %s", e)
         return error_response(9999, f"服务器错误: {str(e)}")
         
     finally:
         # 注意：连接池模式下不需要关闭MongoDB客户端连接
         # 客户端连接会被池管理器自动管理和重用
-        logger.info("MongoDB操作完成") 
\ No newline at end of file
+        logger.debug("MongoDB操作完成") 
+
+def _build_write_model(index: int, operation: MongoDBBulkOperation):
+    """
+    将批量请求中的单个操作转换为pymongo写模型，参数检查与单个操作接口一致
+    
+    Returns:
+        (写模型, None) 或 (None, 错误响应字典)
+    """
+    prefix = f"第{index}个操作: "
+    
+    if operation.operation == "insert":
+        if not operation.document:
+            return None, error_response(1101, prefix + "插入操作缺少document字段，请提供要插入的文档")
+        return InsertOne(operation.document), None
+    
+    if operation.operation in ("update", "updatemany"):
+        if not operation.filter:
+            return None, error_response(1103, prefix + "更新操作缺少filter字段，请提供查询条件")
+        if not operation.update:
+            return None, error_response(1104, prefix + "更新操作缺少update字段，请提供更新内容")
+        if not any(key.startswith('$') for key in operation.update.keys()):
+            return None, error_response(1105, prefix + "更新操作的update字段格式不正确，应包含至少一个更新操作符如 $set, $unset 等")
+        model_class = UpdateOne if operation.operation == "update" else UpdateMany
+        return model_class(operation.filter, operation.update), None
+    
+    # 删除操作
+    if not operation.filter:
+        return None, error_response(1106, prefix + "删除操作缺少filter字段，请提供查询条件")
+    model_class = DeleteOne if operation.operation == "delete" else DeleteMany
+    return model_class(operation.filter), None
+
+@router.post("/mongodb/bulk", response_class=MongoDBResponse)
+def execute_mongodb_bulk(request: MongoDBBulkRequest):
+    """
+    批量执行MongoDB写操作
+    
+    - 支持insert, update, updateMany, delete, deleteMany，所有操作通过一次bulk_write发送
+    - ordered为true时按顺序执行并在第一个错误处停止，为false时继续执行其余操作
+    - 返回插入、更新和删除的文档总数
+    """
+    return MongoDBResponse(_execute_mongodb_bulk(request))
+
+def _execute_mongodb_bulk(request: MongoDBBulkRequest) -> Dict[str, Any]:
+    """批量执行MongoDB写操作，返回统一格式的响应字典"""
+    write_models = []
+    for index, operation in enumerate(request.operations, 1):
+        model, error = _build_write_model(index, operation)
+        if error:
+            return error
+        write_models.append(model)
+    
+    try:
+        # 从连接池获取客户端并确认集合存在
+        collection, error = _get_collection(request)
+        if error:
+            return error
+        
+        result = collection.bulk_write(write_models, ordered=request.ordered)
+        affected_count = result.inserted_count + result.modified_count + result.deleted_count
+        logger.debug("批量执行%d个操作，影响%d个文档", len(write_models), affected_count)
+        return success_response(affected_count)
+        
+    except pymongo.errors.BulkWriteError as e:
+        # 只报告第一个出错的操作，出错前已执行的操作不会回滚
+        error_msg = str(e)
+        write_errors = e.details.get("writeErrors") or []
+        if write_errors:
+            first_error = write_errors[0]
+            error_msg = f"第{first_error['index'] + 1}个操作出错: {first_error.get('errmsg')}"
+        logger.error("MongoDB批量写入错误: %s", error_msg)
+        return error_response(1111, f"批量操作失败: {error_msg}")
+        
+    except pymongo.errors.OperationFailure as e:
+        logger.error("MongoDB操作失败: %s", e)
+        return error_response(1002, f"数据库操作错误: {str(e)}")
+        
+    except PyMongoError as e:
+        logger.error("MongoDB错误: %s", e)
+        return error_response(1000, f"数据库错误: {str(e)}")
+        
+    except Exception as e:
+        logger.error("未预期的错误: %s", e)
+        return error_response(9999, f"服务器错误: {str(e)}")
@@ -1,4 +1,6 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, Field, validator
 from typing import Dict, Any, List, Optional, Union
 import logging
@@ -6,12 +8,76 @@ import psycopg2
 from psycopg2.extras import RealDictCursor
 import psycopg2.errors
 import re
-from app.utils.response import success_response, error_response
+from contextlib import ExitStack
+from app.utils.response import APIResponse, render_json, success_response, error_response
 from app.utils.pool import postgresql_pool
 
 router = APIRouter(tags=["PostgreSQL"])
 logger = logging.getLogger("database-api")
 
+# SQL验证使用的正则表达式，模块加载时编译一次，均作用于小写后的SQL
+SELECT_WITHOUT_COLUMNS_PATTERN = re.compile(r'select\s+from')
+SELECT_ONLY_PATTERN = re.compile(r'select\s*$')
+WHERE_WITHOUT_CONDITION_PATTERN = re.compile(r'where\s+;')
+
+# 常见的拼写错误及修正提示，按顺序检查
+COMMON_TYPOS = (
+    (re.compile(r'\bslect\b'), 'select'),
+    (re.compile(r'\bform\b'), 'from'),
+    (re.compile(r'\bwhere\s+and\b'), 'where'),
+    (re.compile(r'\bgroup\s+order\b'), 'group by ... order'),
+)
+ANY_TYPO_PATTERN = re.compile('|'.join(pattern.pattern for pattern, _ in COMMON_TYPOS))
+
+# 超过该长度的SQL不做启发式验证
+MAX_VALIDATED_SQL_LENGTH = 8192
+
+# 请求指定stream时服务端游标每批读取的行数，结果超过一批时改为流式返回
+STREAM_FETCH_SIZE = 1000
+STREAM_CURSOR_NAME = "database_api_stream"
+
+def _validate_sql(cls, v):
+    """基本的SQL语法验证，作为各请求模型中sql字段的验证器"""
+    if not v or not v.strip():
+        raise ValueError("SQL语句不能为空")
+    
+    # 超长SQL跳过启发式检查，语法错误由PostgreSQL解析时报告
+    if len(v) > MAX_VALIDATED_SQL_LENGTH:
+        return v
+    
+    # 检查常见SQL语法错误
+    sql_lower = v.lower().strip()
+    
+    # 检查SELECT语句是否有FROM子句
+    if sql_lower.startswith('select'):
+        if ' from ' not in sql_lower:
+            raise ValueError("SELECT语句缺少FROM子句")
+        
+        # 检查是否指定了列
+        select_from_parts = sql_lower.partition(' from ')[0]
+        if select_from_parts == 'select' or select_from_parts.strip() == 'select':
+            raise ValueError("SELECT语句缺少列名，请指定要查询的列或使用 SELECT * 查询所有列")
+        
+        # 检查select和from之间是否有非空白字符
+        if SELECT_WITHOUT_COLUMNS_PATTERN.match(sql_lower):
+            raise ValueError("SELECT语句缺少列名，请指定要查询的列或使用 SELECT * 查询所有列")
+        
+    # 检查基本的括号匹配
+    if v.count('(') != v.count(')'):
+        raise ValueError("SQL语句括号不匹配")
+        
+    # 检查WHERE后是否有条件
+    if WHERE_WITHOUT_CONDITION_PATTERN.search(sql_lower):
+        raise ValueError("WHERE子句后缺少条件")
+        
+    # 检查常见的拼写错误，先用合并后的模式扫描一遍，命中后再确定是哪一种
+    if ANY_TYPO_PATTERN.search(sql_lower):
+        for typo_pattern, correction in COMMON_TYPOS:
+            if typo_pattern.search(sql_lower):
+                raise ValueError(f"SQL语句可能存在拼写错误: 检查 '{correction}'")
+            
+    return v
+
 class PostgreSQLConnectionInfo(BaseModel):
     host: str
     port: int = 5432
@@ -25,101 +91,117 @@ class PostgreSQLExecuteRequest(BaseModel):
     connection: PostgreSQLConnectionInfo
     sql: str
     parameters: Optional[Union[List[Any], Dict[str, Any]]] = []
+    # 预计结果集很大时设为True，单条SELECT改用服务端游标分批读取并流式返回
+    stream: bool = False
 
-    @validator('sql')
-    def validate_sql(cls, v):
-        """基本的SQL语法验证"""
-        if not v or not v.strip():
-            raise ValueError("SQL语句不能为空")
-        
-        # 检查常见SQL语法错误
-        sql_lower = v.lower().strip()
-        
-        # 检查SELECT语句是否有FROM子句
-        if sql_lower.startswith('select'):
-            if ' from ' not in sql_lower:
-                raise ValueError("SELECT语句缺少FROM子句")
-            
-            # 检查是否指定了列
-            select_from_parts = sql_lower.split(' from ')[0]
-            if select_from_parts == 'select' or select_from_parts.strip() == 'select':
-                raise ValueError("SELECT语句缺少列名，请指定要查询的列或使用 SELECT * 查询所有列")
-            
-            # 检查select和from之间是否有非空白字符
-            select_part_match = re.match(r'select\s+from', sql_lower)
-            if select_part_match:
-                raise ValueError("SELECT语句缺少列名，请指定要查询的列或使用 SELECT * 查询所有列")
-            
-        # 检查基本的括号匹配
-        if v.count('(') != v.count(')'):
-            raise ValueError("SQL语句括号不匹配")
-            
-        # 检查WHERE后是否有条件
-        where_pattern = re.compile(r'where\s+;', re.IGNORECASE)
-        if where_pattern.search(v):
-            raise ValueError("WHERE子句后缺少条件")
-            
-        # 检查常见的拼写错误
-        common_typos = {
-            r'\bslect\b': 'select', 
-            r'\bform\b': 'from',
-            r'\bwhere\s+and\b': 'where',
-            r'\bgroup\s+order\b': 'group by ... order'
-        }
-        
-        for typo, correction in common_typos.items():
-            if re.search(typo, sql_lower):
-                raise ValueError(f"SQL语句可能存在拼写错误: 检查 '{correction}'")
-                
+    validate_sql = validator('sql', allow_reuse=True)(_validate_sql)
+
+class PostgreSQLStatement(BaseModel):
+    sql: str
+    parameters: Optional[Union[List[Any], Dict[str, Any]]] = []
+
+    validate_sql = validator('sql', allow_reuse=True)(_validate_sql)
+
+class PostgreSQLBulkRequest(BaseModel):
+    connection: PostgreSQLConnectionInfo
+    statements: List[PostgreSQLStatement]
+
+    @validator('statements')
+    def validate_statements(cls, v):
+        if not v:
+            raise ValueError("statements不能为空，请提供要执行的SQL语句列表")
         return v
 
-@router.post("/postgresql")
-async def execute_postgresql(request: PostgreSQLExecuteRequest):
+# psycopg2是同步驱动，路由定义为普通函数，由FastAPI放到线程池中执行，查询期间不阻塞事件循环
+@router.post("/postgresql", response_class=APIResponse)
+def execute_postgresql(request: PostgreSQLExecuteRequest):
     """
     执行PostgreSQL SQL语句
     
     - 支持查询、插入、更新、删除操作
     - 返回查询结果或影响的行数
     """
-    conn = None
+    result = _execute_postgresql(request)
+    if isinstance(result, StreamingResponse):
+        return result
+    return APIResponse(result)
+
+def _use_server_cursor(sql_lower: str) -> bool:
+    """
+    判断查询能否使用服务端游标分批读取
+    
+    DECLARE只接受单条普通SELECT，SELECT INTO和多语句SQL仍按原方式一次性读取
+    """
+    if not sql_lower.startswith('select') or ' into ' in sql_lower:
+        return False
+    return ';' not in sql_lower.rstrip(';')
+
+def _close_cursor(cursor):
+    """关闭游标；事务失败后服务端游标可能无法关闭，此时交给连接归还时的回滚处理"""
     try:
-        # 额外的SQL语法验证
-        sql_lower = request.sql.lower().strip()
-        
-        # 特别检查SELECT语句是否包含列指定
-        if sql_lower.startswith('select'):
-            select_parts = sql_lower.split(' from ')[0].strip()
-            if select_parts == 'select' or re.match(r'select\s*$', select_parts):
-                return error_response(1005, "SQL验证错误: SELECT语句缺少列名，请指定要查询的列或使用 SELECT * 查询所有列")
-        
-        # 从连接池获取连接
-        conn, error = postgresql_pool.get_connection(
-            host=request.connection.host,
-            port=request.connection.port,
-            database=request.connection.database,
-            user=request.connection.user,
-            password=request.connection.password,
-            sslmode=request.connection.sslmode,
-            connect_timeout=request.connection.connect_timeout
-        )
-        
+        cursor.close()
+    except psycopg2.Error as e:
+        logger.debug("关闭游标失败: %s", e)
+
+def _stream_rows(cursor, first_rows: List[Any], cleanup: ExitStack):
+    """
+    分批从服务端游标读取结果并输出JSON片段，响应格式与success_response一致
+    
+    内存占用只与单批行数有关；传输结束后关闭游标并归还连接
+    生成器未开始迭代时(如客户端提前断开)由响应的后台任务调用cleanup.close()释放，重复关闭不会重复释放
+    """
+    try:
+        yield b'{"errCode":0,"data":['
+        rows = first_rows
+        separator = b''
+        while rows:
+            yield separator + b','.join(render_json(row) for row in rows)
+            separator = b','
+            rows = cursor.fetchmany(STREAM_FETCH_SIZE)
+        yield b'],"errMsg":null}'
+    except psycopg2.Error as e:
+        # 响应头已发送，无法再返回错误码，只能中断传输
+        logger.error("流式读取查询结果失败: %s", e)
+        raise
+    finally:
+        cleanup.close()
+
+def _execute_postgresql(request: PostgreSQLExecuteRequest) -> Union[Dict[str, Any], StreamingResponse]:
+    """执行SQL语句，返回统一格式的响应字典；结果集较大的SELECT返回流式响应"""
+    # 额外的SQL语法验证
+    sql_lower = request.sql.lower().strip()
+    
+    # 特别检查SELECT语句是否包含列指定
+    if sql_lower.startswith('select'):
+        select_parts = sql_lower.partition(' from ')[0].strip()
+        if select_parts == 'select' or SELECT_ONLY_PATTERN.match(select_parts):
+            return error_response(1005, "SQL验证错误: SELECT语句缺少列名，请指定要查询的列或使用 SELECT * 查询所有列")
+    
+    # 从连接池获取连接，离开with块时游标关闭、连接自动归还到连接池
+    # 流式返回时由ExitStack把游标和连接转交给生成器，传输结束后再释放
+    with ExitStack() as stack:
+        conn, error = stack.enter_context(postgresql_pool.connection(**request.connection.dict()))
         if error:
-            logger.error(f"从连接池获取连接失败: {error}")
+            logger.error("从连接池获取连接失败: %s", error)
             return error_response(1001, f"数据库连接错误: {error}")
         
-        logger.info(f"成功从连接池获取连接: {request.connection.host}:{request.connection.port}/{request.connection.database}")
+        logger.debug("成功从连接池获取连接: %s:%s/%s", request.connection.host, request.connection.port, request.connection.database)
         
-        # 创建游标，使用RealDictCursor返回字典格式结果
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        try:
+            # 创建游标，使用RealDictCursor返回字典格式结果
+            # 服务端游标需要额外的DECLARE/FETCH/CLOSE往返，只在请求指定stream时对单条SELECT使用
+            cursor_name = STREAM_CURSOR_NAME if request.stream and _use_server_cursor(sql_lower) else None
+            cursor = conn.cursor(name=cursor_name, cursor_factory=RealDictCursor)
+            stack.callback(_close_cursor, cursor)
             # 执行SQL
-            logger.info(f"执行SQL: {request.sql}")
-            
+            logger.debug("执行SQL: %s", request.sql)
+    
             try:
                 cursor.execute(request.sql, request.parameters)
             except psycopg2.ProgrammingError as e:
                 # 捕获SQL执行错误，提供更详细的错误信息
                 error_msg = str(e)
-                
+        
                 # 尝试提取更有用的错误信息
                 if "column" in error_msg and "does not exist" in error_msg:
                     match = re.search(r'column "([^"]+)" does not exist', error_msg)
@@ -135,108 +217,130 @@ async def execute_postgresql(request: PostgreSQLExecuteRequest):
                         error_msg = f"SQL语法错误，问题出现在: '{problematic_part}'"
                 elif "SELECT列表中的表达式" in error_msg or "column reference" in error_msg or "no columns specified" in error_msg:
                     error_msg = "SELECT语句缺少列名，请指定要查询的列或使用 SELECT * 查询所有列"
-                
-                logger.error(f"SQL执行错误: {error_msg}")
+        
+                logger.error("SQL执行错误: %s", error_msg)
                 return error_response(1003, f"SQL执行错误: {error_msg}")
-            
+    
             # 检查结果是否为空
             sql_type = request.sql.strip().upper().split(None, 1)[0]
-            
+    
             if sql_type in ("SELECT", "WITH", "SHOW", "EXPLAIN"):
                 # 查询操作，返回结果集
-                result = cursor.fetchall()
-                
-                # 将结果转换为普通字典列表
-                result_list = []
-                
-                for row in result:
-                    row_dict = {}
-                    # RealDictRow实际上是类似字典的对象，可以直接迭代其key-value对
-                    for key in row.keys():
-                        value = row[key]
-                        # 处理特殊数据类型
-                        if hasattr(value, 'isoformat'):  # 日期/时间类型
-                            row_dict[key] = value.isoformat()
-                        elif isinstance(value, (int, float, str, bool, type(None))):
-                            row_dict[key] = value
-                        else:
-                            row_dict[key] = str(value)  # 其他类型转为字符串
-                    
-                    result_list.append(row_dict)
-                
+                if cursor.name:
+                    # 先读取第一批，查询执行错误仍能在这里返回对应的错误码
+                    result = cursor.fetchmany(STREAM_FETCH_SIZE)
+                    if len(result) == STREAM_FETCH_SIZE:
+                        logger.debug("查询结果超过一批，改为流式返回")
+                        cleanup = stack.pop_all()
+                        return StreamingResponse(
+                            _stream_rows(cursor, result, cleanup),
+                            media_type="application/json",
+                            # 无论生成器是否被迭代，响应结束后都释放游标和连接
+                            background=BackgroundTask(cleanup.close)
+                        )
+                else:
+                    result = cursor.fetchall()
+        
                 # 检查结果是否为空
-                if not result_list:
-                    logger.info("SQL查询未返回任何结果")
-                
-                return success_response(result_list)
+                if not result:
+                    logger.debug("SQL查询未返回任何结果")
+        
+                # RealDictRow是dict的子类，直接交给orjson序列化，特殊类型由APIResponse统一处理
+                return success_response(result)
             else:
                 # 非查询操作，提交事务并返回影响行数
                 conn.commit()
                 affected_rows = cursor.rowcount
-                
+        
                 # 检查影响的行数
                 if affected_rows == 0:
-                    logger.info("SQL操作未影响任何行")
-                
+                    logger.debug("SQL操作未影响任何行")
+        
                 return success_response(affected_rows)
-                
-    except psycopg2.OperationalError as e:
-        logger.error(f"PostgreSQL连接错误: {str(e)}")
-        return error_response(1001, f"数据库连接错误: {str(e)}")
-    except psycopg2.errors.UndefinedTable as e:
-        # 提取表名
-        error_msg = str(e)
-        match = re.search(r'relation "([^"]+)" does not exist', error_msg)
-        if match:
-            table_name = match.group(1)
-            error_msg = f"表 '{table_name}' 不存在"
-        
-        logger.error(f"表不存在: {error_msg}")
-        return error_response(1002, f"表不存在: {error_msg}")
-    except psycopg2.errors.SyntaxError as e:
-        error_msg = str(e)
-        
-        # 特殊处理SELECT语句缺少列
-        if "SELECT" in error_msg and ("column reference" in error_msg or "target lists" in error_msg):
-            error_msg = "SELECT语句缺少列名，请指定要查询的列或使用 SELECT * 查询所有列"
-        
-        logger.error(f"SQL语法错误: {error_msg}")
-        return error_response(1003, f"SQL语法错误: {error_msg}")
-    except psycopg2.errors.InFailedSqlTransaction as e:
-        logger.error(f"SQL事务失败: {str(e)}")
-        if conn:
+        
+        except psycopg2.OperationalError as e:
+            logger.error("PostgreSQL连接错误: %s", e)
+            return error_response(1001, f"数据库连接错误: {str(e)}")
+        except psycopg2.errors.UndefinedTable as e:
+            # 提取表名
+            error_msg = str(e)
+            match = re.search(r'relation "([^"]+)" does not exist', error_msg)
+            if match:
+                table_name = match.group(1)
+                error_msg = f"表 '{table_name}' 不存在"
+        
+            logger.error("表不存在: %s", error_msg)
+            return error_response(1002, f"表不存在: {error_msg}")
+        except psycopg2.errors.SyntaxError as e:
+            error_msg = str(e)
+        
+            # 特殊处理SELECT语句缺少列
+            if "SELECT" in error_msg and ("column reference" in error_msg or "target lists" in error_msg):
+                error_msg = "SELECT语句缺少列名，请指定要查询的列或使用 SELECT * 查询所有列"
+        
+            logger.error("SQL语法错误: %s", error_msg)
+            return error_response(1003, f"SQL语法错误: {error_msg}")
+        except psycopg2.errors.InFailedSqlTransaction as e:
+            logger.error("SQL事务失败: %s", e)
             conn.rollback()
-        return error_response(1004, f"SQL事务失败: {str(e)}")
-    except psycopg2.Error as e:
-        logger.error(f"PostgreSQL错误: {str(e)}")
-        if conn:
+            return error_response(1004, f"SQL事务失败: {str(e)}")
+        except psycopg2.Error as e:
+            logger.error("PostgreSQL错误: %s", e)
             conn.rollback()
-        return error_response(1000, f"数据库错误: {str(e)}")
-    except ValueError as e:
-        # 处理SQL验证错误
-        logger.error(f"SQL验证错误: {str(e)}")
-        return error_response(1005, f"SQL验证错误: {str(e)}")
-    except Exception as e:
-        logger.error(f"未预期的错误: {str(e)}")
-        if conn:
+            return error_response(1000, f"数据库错误: {str(e)}")
+        except ValueError as e:
+            # 处理SQL验证错误
+            logger.error("SQL验证错误: %s", e)
+            return error_response(1005, f"SQL验证错误: {str(e)}")
+        except Exception as e:
+            logger.error("未预期的错误: %s", e)
             conn.rollback()
-        return error_response(9999, f"服务器错误: {str(e)}")
-    finally:
-        # 释放连接回连接池，而不是关闭连接
-        if conn:
-            try:
-                postgresql_pool.release_connection(
-                    host=request.connection.host, 
-                    port=request.connection.port, 
-                    database=request.connection.database, 
-                    user=request.connection.user, 
-                    conn=conn
-                )
-                logger.info("数据库连接已归还到连接池")
-            except Exception as e:
-                logger.error(f"归还连接到连接池失败: {str(e)}")
-                try:
-                    conn.close()
-                    logger.info("无法归还到连接池，已关闭连接")
-                except:
-                    pass 
\ No newline at end of file
+            return error_response(9999, f"服务器错误: {str(e)}")
+
+@router.post("/postgresql/bulk", response_class=APIResponse)
+def execute_postgresql_bulk(request: PostgreSQLBulkRequest):
+    """
+    批量执行PostgreSQL SQL语句
+    
+    - 所有语句在同一个连接和事务中依次执行，任意一条失败则全部回滚
+    - 返回所有语句影响的总行数
+    """
+    return APIResponse(_execute_postgresql_bulk(request))
+
+def _execute_postgresql_bulk(request: PostgreSQLBulkRequest) -> Dict[str, Any]:
+    """批量执行SQL语句，返回统一格式的响应字典"""
+    with postgresql_pool.connection(**request.connection.dict()) as (conn, error):
+        if error:
+            logger.error("从连接池获取连接失败: %s", error)
+            return error_response(1001, f"数据库连接错误: {error}")
+        
+        index = 0
+        try:
+            affected_rows = 0
+            with conn.cursor() as cursor:
+                for index, statement in enumerate(request.statements, 1):
+                    cursor.execute(statement.sql, statement.parameters)
+                    # 只统计写操作影响的行数：返回结果集的语句(SELECT、带RETURNING的语句)rowcount是结果行数，DDL等语句的rowcount为-1
+                    if cursor.description is None and cursor.rowcount > 0:
+                        affected_rows += cursor.rowcount
+            
+            # 提交失败(如延迟检查的约束)不属于某一条语句
+            index = 0
+            conn.commit()
+            logger.debug("批量执行%d条SQL语句，影响%d行", len(request.statements), affected_rows)
+            return success_response(affected_rows)
+            
+        except psycopg2.OperationalError as e:
+            logger.error("PostgreSQL连接错误: %s", e)
+            return error_response(1001, f"数据库连接错误: {str(e)}")
+        except psycopg2.Error as e:
+            conn.rollback()
+            if not index:
+                logger.error("批量执行提交事务失败: %s", e)
+                return error_response(1006, f"批量执行失败，提交事务时出错，所有语句已回滚: {str(e)}")
+            logger.error("批量执行第%d条SQL语句失败: %s", index, e)
+            return error_response(1006, f"批量执行失败，第{index}条语句出错，所有语句已回滚: {str(e)}")
+        except Exception as e:
+            logger.error("未预期的错误: %s", e)
+            conn.rollback()
+            return error_response(9999, f"服务器错误: {str(e)}")
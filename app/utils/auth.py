@@ -1,6 +1,8 @@
+import hmac
 import os
 import secrets
 import json
+import tempfile
 import logging
 from pathlib import Path
 from fastapi import HTTPException, Header
@@ -14,48 +16,135 @@ BASE_DIR = Path(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
 CONFIG_DIR = BASE_DIR / "config"
 TOKEN_CONFIG_FILE = CONFIG_DIR / "access_token.json"
 
-# 全局变量存储加载的访问令牌
+# 全局变量存储加载的访问令牌及其字节串形式（用于直接与原始请求头比较）
 ACCESS_TOKEN = None
+ACCESS_TOKEN_BYTES = None
+
+# 配置文件中令牌的缓存：(文件修改时间, 令牌)，整体替换以保证并发读取时两者一致
+_config_token_cache = (None, None)
 
 def generate_access_token() -> str:
     """生成一个随机的访问令牌"""
     return secrets.token_hex(32)  # 生成一个64字符的十六进制字符串
 
-def save_access_token(token: str) -> None:
-    """将访问令牌保存到配置文件"""
+def save_access_token(token: str, overwrite: bool = False) -> bool:
+    """
+    将访问令牌保存到配置文件
+    
+    先写入临时文件，再用os.link创建配置文件，其他进程不会读到写了一半的文件；
+    配置文件已存在且overwrite为False时不写入，多个工作进程同时启动时只有一个能创建成功
+    
+    Returns:
+        是否写入了配置文件
+    """
     # 确保配置目录存在
     CONFIG_DIR.mkdir(exist_ok=True)
     
-    # 保存令牌到配置文件
-    with open(TOKEN_CONFIG_FILE, "w") as f:
-        json.dump({"accessToken": token}, f, indent=2)
+    fd, tmp_path = tempfile.mkstemp(dir=CONFIG_DIR, prefix=".access_token.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump({"accessToken": token}, f, indent=2)
+        if overwrite:
+            os.replace(tmp_path, TOKEN_CONFIG_FILE)
+        else:
+            try:
+                os.link(tmp_path, TOKEN_CONFIG_FILE)
+            except FileExistsError:
+                return False
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
     
-    logger.info(f"访问令牌已保存到 {TOKEN_CONFIG_FILE}")
+    logger.info("访问令牌已保存到 %s", TOKEN_CONFIG_FILE)
+    return True
 
-def load_access_token() -> str:
-    """从配置文件加载访问令牌，如果不存在则生成一个新的"""
+def _read_token_file() -> Optional[str]:
+    """
+    读取配置文件中的令牌，内容无效时返回None
+    
+    Raises:
+        FileNotFoundError: 配置文件不存在
+    """
     try:
         with open(TOKEN_CONFIG_FILE, "r") as f:
             config = json.load(f)
-            token = config.get("accessToken")
-            if token:
-                logger.info("已从配置文件加载访问令牌")
-                return token
-            else:
-                logger.warning("配置文件中没有找到accessToken字段")
-    except (FileNotFoundError, json.JSONDecodeError) as e:
-        logger.warning(f"加载访问令牌失败: {str(e)}")
+    except json.JSONDecodeError as e:
+        logger.warning("加载访问令牌失败: %s", e)
+        return None
     
-    # 如果配置文件不存在或无效，生成一个新的令牌
+    token = config.get("accessToken")
+    if not token:
+        logger.warning("配置文件中没有找到accessToken字段")
+    return token
+
+def load_access_token() -> str:
+    """从配置文件加载访问令牌，如果不存在则生成一个新的"""
+    try:
+        token = _read_token_file()
+        file_exists = True
+    except FileNotFoundError:
+        token = None
+        file_exists = False
+    if token:
+        logger.info("已从配置文件加载访问令牌")
+        return token
+    
+    # 配置文件存在但内容无效时直接覆盖，不存在时只在没有其他进程抢先创建的情况下写入
     token = generate_access_token()
-    save_access_token(token)
-    logger.info("已生成新的访问令牌")
+    if save_access_token(token, overwrite=file_exists):
+        logger.info("已生成新的访问令牌")
+        return token
+    
+    # 其他工作进程已先创建配置文件，使用其中的令牌，保证所有工作进程的令牌一致
+    token = _read_token_file()
+    if not token:
+        raise RuntimeError(f"无法从 {TOKEN_CONFIG_FILE} 读取访问令牌")
+    logger.info("已从配置文件加载其他进程生成的访问令牌")
     return token
 
+def read_config_token() -> Optional[str]:
+    """
+    读取配置文件中的访问令牌
+    
+    文件修改时间未变化时直接返回缓存的令牌，不重复打开和解析配置文件
+    
+    Raises:
+        FileNotFoundError: 配置文件不存在
+    """
+    global _config_token_cache
+    mtime = os.stat(TOKEN_CONFIG_FILE).st_mtime_ns
+    cached_mtime, cached_token = _config_token_cache
+    if mtime == cached_mtime:
+        return cached_token
+    
+    with open(TOKEN_CONFIG_FILE, "r") as f:
+        config = json.load(f)
+        token = config.get("accessToken")
+    
+    _config_token_cache = (mtime, token)
+    return token
+
+def get_access_token() -> Optional[str]:
+    """获取当前有效的访问令牌，优先使用initialize_auth加载的令牌，尚未初始化时才读取配置文件"""
+    if ACCESS_TOKEN:
+        return ACCESS_TOKEN
+    try:
+        return read_config_token()
+    except FileNotFoundError:
+        return None
+
+def get_access_token_bytes() -> Optional[bytes]:
+    """获取当前有效访问令牌的字节串形式"""
+    if ACCESS_TOKEN_BYTES:
+        return ACCESS_TOKEN_BYTES
+    token = get_access_token()
+    return token.encode() if token else None
+
 def initialize_auth():
     """初始化认证系统，加载或生成访问令牌"""
-    global ACCESS_TOKEN
+    global ACCESS_TOKEN, ACCESS_TOKEN_BYTES
     ACCESS_TOKEN = load_access_token()
+    ACCESS_TOKEN_BYTES = ACCESS_TOKEN.encode()
     logger.info("认证系统初始化完成")
 
 async def verify_access_token(access_token: Optional[str] = Header(None, alias="accessToken")) -> bool:
@@ -67,7 +156,9 @@ async def verify_access_token(access_token: Optional[str] = Header(None, alias="
             detail="缺少accessToken头",
         )
         
-    if access_token != ACCESS_TOKEN:
+    # 按字节串做恒定时间比较，避免通过响应时间推测令牌
+    expected_token = get_access_token_bytes()
+    if not expected_token or not hmac.compare_digest(access_token.encode(), expected_token):
         logger.warning("无效的访问令牌")
         raise HTTPException(
             status_code=401,
@@ -1,77 +1,63 @@
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Scope
+import hmac
 import logging
-import json
-import os
-from pathlib import Path
-from app.utils.response import error_response
+from typing import Optional
+from app.utils.auth import get_access_token_bytes
+from app.utils.response import prerendered_error_response
 
 # 配置日志
 logger = logging.getLogger("database-api")
 
-# 定义配置文件路径
-BASE_DIR = Path(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-CONFIG_DIR = BASE_DIR / "config"
-TOKEN_CONFIG_FILE = CONFIG_DIR / "access_token.json"
+# 不需要验证令牌的路径（根路径、文档路径和令牌查询接口）
+PUBLIC_PATHS = frozenset({"/", "/docs", "/redoc", "/openapi.json", "/apiDatabase/token"})
 
-class AuthMiddleware(BaseHTTPMiddleware):
-    """
-    身份验证中间件，验证请求头中的访问令牌
+# 预先构造固定的错误响应，拒绝请求时无需重复序列化
+MISSING_TOKEN_RESPONSE = prerendered_error_response(401, 1401, "缺少accessToken头")
+CONFIG_READ_ERROR_RESPONSE = prerendered_error_response(500, 9001, "服务器配置错误")
+TOKEN_UNAVAILABLE_RESPONSE = prerendered_error_response(500, 9002, "服务器配置错误")
+INVALID_TOKEN_RESPONSE = prerendered_error_response(401, 1402, "无效的访问令牌")
+
+def _get_header_token(scope: Scope) -> Optional[bytes]:
+    """从ASGI原始请求头中读取accessToken，头名称已由服务器统一转为小写字节串，值保持原始字节不解码"""
+    for name, value in scope["headers"]:
+        if name == b"accesstoken":
+            return value
+    return None
+
+def authenticate(scope: Scope) -> Optional[ASGIApp]:
     """
+    验证HTTP请求头中的访问令牌
     
-    async def dispatch(self, request: Request, call_next):
-        """
-        处理请求，验证访问令牌
-        """
-        # 排除根路径和文档路径，不需要验证
-        if request.url.path in ["/", "/docs", "/redoc", "/openapi.json", "/apiDatabase/token"]:
-            return await call_next(request)
-        
-        # 从请求头获取访问令牌
-        token = request.headers.get("accessToken")
-        if not token:
-            logger.warning("请求缺少accessToken头")
-            return JSONResponse(
-                status_code=401,
-                content=error_response(1401, "缺少accessToken头")
-            )
-        
-        # 从配置文件读取有效令牌
-        expected_token = None
-        try:
-            if TOKEN_CONFIG_FILE.exists():
-                with open(TOKEN_CONFIG_FILE, "r") as f:
-                    config = json.load(f)
-                    expected_token = config.get("accessToken")
-        except Exception as e:
-            logger.error(f"读取配置文件失败: {str(e)}")
-            return JSONResponse(
-                status_code=500,
-                content=error_response(9001, "服务器配置错误")
-            )
-            
-        if not expected_token:
-            logger.error("无法获取有效的访问令牌")
-            return JSONResponse(
-                status_code=500,
-                content=error_response(9002, "服务器配置错误")
-            )
+    Args:
+        scope: ASGI请求信息
         
-        # 验证令牌
-        if token != expected_token:
-            logger.warning("无效的访问令牌")
-            return JSONResponse(
-                status_code=401,
-                content=error_response(1402, "无效的访问令牌")
-            )
+    Returns:
+        验证失败时返回对应的错误响应，验证通过或无需验证时返回None
+    """
+    # 根路径和文档路径，不需要验证
+    if scope["path"] in PUBLIC_PATHS:
+        return None
+    
+    # 从请求头获取访问令牌
+    token = _get_header_token(scope)
+    if not token:
+        logger.warning("请求缺少accessToken头")
+        return MISSING_TOKEN_RESPONSE
+    
+    # 获取有效令牌（启动时已加载到内存）
+    try:
+        expected_token = get_access_token_bytes()
+    except Exception as e:
+        logger.error("读取配置文件失败: %s", e)
+        return CONFIG_READ_ERROR_RESPONSE
         
-        # 验证通过，继续处理请求
-        try:
-            return await call_next(request)
-        except Exception as e:
-            logger.error(f"请求处理过程中发生错误: {str(e)}", exc_info=True)
-            return JSONResponse(
-                status_code=500,
-                content=error_response(9999, "内部服务器错误")
-            ) 
\ No newline at end of file
+    if not expected_token:
+        logger.error("无法获取有效的访问令牌")
+        return TOKEN_UNAVAILABLE_RESPONSE
+    
+    # 验证令牌，直接比较字节串，并使用恒定时间比较避免通过响应时间推测令牌
+    if not hmac.compare_digest(token, expected_token):
+        logger.warning("无效的访问令牌")
+        return INVALID_TOKEN_RESPONSE
+    
+    return None
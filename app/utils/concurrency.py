@@ -1,16 +1,17 @@
 import asyncio
 import logging
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from typing import Callable, Optional
+from starlette.types import ASGIApp, Receive, Scope, Send
 
 logger = logging.getLogger("database-api")
 
-class ConcurrencyLimiterMiddleware(BaseHTTPMiddleware):
+class ConcurrencyLimiterMiddleware:
     """
     并发请求限制中间件
     
     用于控制同时处理的请求数量，防止过多并发请求导致服务器过载
+    直接实现ASGI接口，请求体由下游处理器直接读取，中间件不做任何包装
+    可同时完成身份验证，省去单独的验证中间件这一层调用
     """
     
     def __init__(
@@ -18,7 +19,8 @@ class ConcurrencyLimiterMiddleware(BaseHTTPMiddleware):
         app: ASGIApp, 
         max_concurrent_requests: int = 20,
         postgresql_max_concurrent: int = 10,
-        mongodb_max_concurrent: int = 10
+        mongodb_max_concurrent: int = 10,
+        authenticate: Optional[Callable[[Scope], Optional[ASGIApp]]] = None
     ):
         """
         初始化并发限制器
@@ -28,66 +30,68 @@ class ConcurrencyLimiterMiddleware(BaseHTTPMiddleware):
             max_concurrent_requests: 最大并发请求数
             postgresql_max_concurrent: PostgreSQL最大并发请求数
             mongodb_max_concurrent: MongoDB最大并发请求数
+            authenticate: 可选的身份验证函数，验证失败时返回错误响应，通过时返回None
         """
-        super().__init__(app)
-        self.semaphore = asyncio.Semaphore(max_concurrent_requests)
-        self.postgresql_semaphore = asyncio.Semaphore(postgresql_max_concurrent)
-        self.mongodb_semaphore = asyncio.Semaphore(mongodb_max_concurrent)
+        self.app = app
+        self.authenticate = authenticate
+        self.semaphore = asyncio.BoundedSemaphore(max_concurrent_requests)
+        self.postgresql_semaphore = asyncio.BoundedSemaphore(postgresql_max_concurrent)
+        self.mongodb_semaphore = asyncio.BoundedSemaphore(mongodb_max_concurrent)
         self.max_concurrent_requests = max_concurrent_requests
         self.postgresql_max_concurrent = postgresql_max_concurrent
         self.mongodb_max_concurrent = mongodb_max_concurrent
         
-        # 计数器
-        self.current_requests = 0
-        self.current_postgresql_requests = 0
-        self.current_mongodb_requests = 0
+        # 数据库类型到(信号量, 日志名称, 最大并发数)的映射
+        self.database_limits = {
+            "postgresql": (self.postgresql_semaphore, "PostgreSQL", postgresql_max_concurrent),
+            "mongodb": (self.mongodb_semaphore, "MongoDB", mongodb_max_concurrent),
+        }
         
-        logger.info(f"初始化并发限制中间件: 总并发={max_concurrent_requests}, PostgreSQL={postgresql_max_concurrent}, MongoDB={mongodb_max_concurrent}")
+        logger.info("初始化并发限制中间件: 总并发=%d, PostgreSQL=%d, MongoDB=%d", max_concurrent_requests, postgresql_max_concurrent, mongodb_max_concurrent)
         
-    async def dispatch(self, request: Request, call_next):
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
         """处理请求的中间件方法"""
-        path = request.url.path
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
         
-        # 根据路径选择合适的信号量
-        if "/postgresql" in path:
-            semaphore = self.postgresql_semaphore
-            async with semaphore:
-                self.current_postgresql_requests += 1
-                try:
-                    logger.debug(f"PostgreSQL当前并发请求数: {self.current_postgresql_requests}/{self.postgresql_max_concurrent}")
-                    return await self._process_request(request, call_next)
-                finally:
-                    self.current_postgresql_requests -= 1
-        elif "/mongodb" in path:
-            semaphore = self.mongodb_semaphore
-            async with semaphore:
-                self.current_mongodb_requests += 1
-                try:
-                    logger.debug(f"MongoDB当前并发请求数: {self.current_mongodb_requests}/{self.mongodb_max_concurrent}")
-                    return await self._process_request(request, call_next)
-                finally:
-                    self.current_mongodb_requests -= 1
-        else:
+        # 先验证身份，被拒绝的请求不占用并发名额
+        if self.authenticate is not None:
+            rejection = self.authenticate(scope)
+            if rejection is not None:
+                await rejection(scope, receive, send)
+                return
+        
+        path = scope["path"]
+        
+        # 路径形如 /apiDatabase/postgresql[/bulk]，按第二段的数据库类型选择合适的信号量
+        segments = path.split("/", 3)
+        database_limit = self.database_limits.get(segments[2]) if len(segments) > 2 else None
+        
+        if database_limit is None:
             # 其他请求使用通用信号量
             async with self.semaphore:
-                self.current_requests += 1
-                try:
-                    logger.debug(f"当前并发请求数: {self.current_requests}/{self.max_concurrent_requests}")
-                    return await call_next(request)
-                finally:
-                    self.current_requests -= 1
+                # 当前并发数由信号量剩余值推算，只在开启调试日志时计算
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("当前并发请求数: %d/%d", self.max_concurrent_requests - self.semaphore._value, self.max_concurrent_requests)
+                await self.app(scope, receive, send)
+            return
+        
+        semaphore, name, max_concurrent = database_limit
+        async with semaphore:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("%s当前并发请求数: %d/%d", name, max_concurrent - semaphore._value, max_concurrent)
+            await self._process_request(scope, receive, send, path)
     
-    async def _process_request(self, request: Request, call_next):
+    async def _process_request(self, scope: Scope, receive: Receive, send: Send, path: str):
         """处理请求并记录执行时间"""
-        # 记录请求开始时间
-        import time
-        start_time = time.time()
+        # 记录请求开始时间，使用事件循环的单调时钟
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
         
         # 处理请求
-        response = await call_next(request)
+        await self.app(scope, receive, send)
         
         # 计算执行时间
-        execution_time = time.time() - start_time
-        logger.info(f"请求 {request.url.path} 执行时间: {execution_time:.3f}秒")
-        
-        return response 
\ No newline at end of file
+        execution_time = loop.time() - start_time
+        logger.info("请求 %s 执行时间: %.3f秒", path, execution_time)
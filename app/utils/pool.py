@@ -1,123 +1,252 @@
+import asyncio
 import logging
+import os
 import time
 import threading
+from contextlib import contextmanager
 from typing import Dict, Any, Optional, List, Tuple
+from urllib.parse import quote_plus
 import psycopg2
-from psycopg2.pool import ThreadedConnectionPool
+from psycopg2.pool import ThreadedConnectionPool, PoolError
 from psycopg2.extras import RealDictCursor
 import pymongo
 from pymongo.mongo_client import MongoClient
 
 logger = logging.getLogger("database-api")
 
+# 每个PostgreSQL连接池的最小和最大连接数，可通过环境变量调整
+# 最小连接数在创建连接池时预先建立，也是归还后保留的空闲连接数，超出部分归还时会被关闭
+POSTGRESQL_POOL_MIN_CONN = int(os.environ.get("POSTGRESQL_POOL_MIN_CONN", 5))
+POSTGRESQL_POOL_MAX_CONN = int(os.environ.get("POSTGRESQL_POOL_MAX_CONN", 30))
+
+class _CleanupTimer:
+    """在事件循环上定时触发清理函数，清理函数放到线程池中执行，关闭连接时不阻塞事件循环"""
+    
+    def __init__(self, cleanup, interval: float):
+        self._cleanup = cleanup
+        self._interval = interval
+        self._loop = None
+        self._handle = None
+        self._future = None
+    
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """开始定时清理"""
+        self._loop = loop
+        self._schedule()
+    
+    def stop(self):
+        """停止定时清理"""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+    
+    def _schedule(self):
+        self._handle = self._loop.call_later(self._interval, self._run)
+    
+    def _run(self):
+        # 上一次清理仍在执行时跳过本次
+        if self._future is None or self._future.done():
+            self._future = self._loop.run_in_executor(None, self._cleanup)
+            self._future.add_done_callback(self._log_error)
+        self._schedule()
+    
+    @staticmethod
+    def _log_error(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("定时清理失败: %s", future.exception(), exc_info=future.exception())
+
+
+class _BlockingConnectionPool(ThreadedConnectionPool):
+    """
+    连接用尽时等待其他请求归还连接的连接池
+    
+    ThreadedConnectionPool在连接数达到maxconn时会立即抛出PoolError，
+    这里用信号量限制同时取出的连接数，超出的请求等待，等待时间与连接超时相同
+    """
+    
+    def __init__(self, minconn: int, maxconn: int, *args, **kwargs):
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._wait_timeout = kwargs.get("connect_timeout")
+    
+    def getconn(self, key=None):
+        if not self._slots.acquire(timeout=self._wait_timeout):
+            raise PoolError("等待可用连接超时，连接池已满")
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._slots.release()
+            raise
+    
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self._slots.release()
+
+
 class PostgreSQLConnectionPool:
     """PostgreSQL连接池管理器，使用ThreadedConnectionPool实现"""
     
     _instance = None
+    # _lock保护连接池字典和最后使用时间，只在字典操作期间持有；_create_lock串行化连接池的创建，建立连接期间不阻塞其他请求取用已有连接池
     _lock = threading.Lock()
-    _pools: Dict[str, ThreadedConnectionPool] = {}
+    _create_lock = threading.Lock()
+    _pools: Dict[Tuple[str, int, str, str], ThreadedConnectionPool] = {}
+    _last_used: Dict[Tuple[str, int, str, str], float] = {}
+    # 每个连接池已取出未归还的连接数，清理时跳过仍有连接在使用的连接池
+    _checked_out: Dict[Tuple[str, int, str, str], int] = {}
     
     def __new__(cls):
         with cls._lock:
             if cls._instance is None:
                 cls._instance = super(PostgreSQLConnectionPool, cls).__new__(cls)
                 cls._instance._pools = {}
-                # 添加清理线程
-                cleanup_thread = threading.Thread(target=cls._instance._cleanup_idle_pools, daemon=True)
-                cleanup_thread.start()
+                cls._instance._last_used = {}
+                cls._instance._checked_out = {}
+                # 每5分钟检查一次闲置连接池，由应用启动时开始
+                cls._instance._cleanup_timer = _CleanupTimer(cls._instance._cleanup_idle_pools, 300)
             return cls._instance
     
     def get_connection(self, host: str, port: int, database: str, user: str, 
                        password: str, sslmode: str = "prefer", connect_timeout: int = 30) -> Tuple[Any, str]:
         """获取数据库连接，如果连接池不存在则创建新的连接池"""
-        pool_key = f"{host}:{port}:{database}:{user}"
+        # 直接用元组作为连接池的键，省去每次请求的字符串拼接
+        pool_key = (host, port, database, user)
+        
+        # 取连接池和更新最后使用时间在同一把锁内完成，清理线程不会关闭刚被取用的连接池
+        pool = self._get_pool(pool_key)
         
-        # 检查连接池是否存在，不存在则创建
-        if pool_key not in self._pools:
-            with self._lock:
-                if pool_key not in self._pools:
+        # 连接池不存在则创建
+        if pool is None:
+            with self._create_lock:
+                pool = self._get_pool(pool_key)
+                if pool is None:
                     try:
                         # 创建新的连接池
-                        logger.info(f"创建PostgreSQL连接池: {host}:{port}/{database}")
-                        dsn = f"host={host} port={port} dbname={database} user={user} password={password} sslmode={sslmode} connect_timeout={connect_timeout}"
-                        pool = ThreadedConnectionPool(
-                            minconn=1,  # 最小连接数，设为1保持至少一个连接
-                            maxconn=30,  # 最大连接数，增加到30
-                            dsn=dsn
+                        logger.info("创建PostgreSQL连接池: %s:%s/%s", host, port, database)
+                        pool = _BlockingConnectionPool(
+                            minconn=POSTGRESQL_POOL_MIN_CONN,
+                            maxconn=POSTGRESQL_POOL_MAX_CONN,
+                            host=host,
+                            port=port,
+                            dbname=database,
+                            user=user,
+                            password=password,
+                            sslmode=sslmode,
+                            connect_timeout=connect_timeout,
+                            # 开启TCP保活，尽早发现被NAT或防火墙断开的空闲连接
+                            keepalives=1,
+                            keepalives_idle=30,
+                            keepalives_interval=10,
+                            keepalives_count=3,
+                            application_name="database-api"
                         )
-                        self._pools[pool_key] = {
-                            "pool": pool,
-                            "last_used": time.time()
-                        }
                     except Exception as e:
-                        logger.error(f"创建PostgreSQL连接池失败: {str(e)}")
+                        logger.error("创建PostgreSQL连接池失败: %s", e)
                         return None, str(e)
-        
-        # 更新最后使用时间
-        self._pools[pool_key]["last_used"] = time.time()
+                    with self._lock:
+                        self._pools[pool_key] = pool
+                        self._last_used[pool_key] = time.time()
         
         try:
             # 从连接池获取连接
-            conn = self._pools[pool_key]["pool"].getconn()
-            return conn, None
+            conn = pool.getconn()
         except Exception as e:
-            logger.error(f"从PostgreSQL连接池获取连接失败: {str(e)}")
+            logger.error("从PostgreSQL连接池获取连接失败: %s", e)
             return None, str(e)
+        
+        with self._lock:
+            self._checked_out[pool_key] = self._checked_out.get(pool_key, 0) + 1
+        return conn, None
+    
+    def _get_pool(self, pool_key: Tuple[str, int, str, str]) -> Optional[ThreadedConnectionPool]:
+        """取出已有的连接池并更新最后使用时间，不存在时返回None"""
+        with self._lock:
+            pool = self._pools.get(pool_key)
+            if pool is not None:
+                self._last_used[pool_key] = time.time()
+            return pool
     
     def release_connection(self, host: str, port: int, database: str, user: str, conn):
         """释放连接回连接池"""
-        pool_key = f"{host}:{port}:{database}:{user}"
-        if pool_key in self._pools:
+        pool_key = (host, port, database, user)
+        pool = self._get_pool(pool_key)
+        if pool is not None:
             try:
-                self._pools[pool_key]["pool"].putconn(conn)
-                # 更新最后使用时间
-                self._pools[pool_key]["last_used"] = time.time()
+                pool.putconn(conn)
             except Exception as e:
-                logger.error(f"释放PostgreSQL连接失败: {str(e)}")
+                logger.error("释放PostgreSQL连接失败: %s", e)
                 # 如果释放失败，关闭连接
                 try:
                     conn.close()
                 except:
                     pass
+        
+        with self._lock:
+            if self._checked_out.get(pool_key, 0) > 0:
+                self._checked_out[pool_key] -= 1
+    
+    @contextmanager
+    def connection(self, host: str, port: int, database: str, user: str, 
+                   password: str, sslmode: str = "prefer", connect_timeout: int = 30):
+        """以上下文管理器方式获取连接，得到(conn, error)，退出时无论是否异常都会归还连接"""
+        conn, error = self.get_connection(host, port, database, user, password, sslmode, connect_timeout)
+        try:
+            yield conn, error
+        finally:
+            if conn:
+                self.release_connection(host, port, database, user, conn)
+    
+    def start_cleanup(self, loop: asyncio.AbstractEventLoop):
+        """在事件循环上开始定时清理闲置连接池"""
+        self._cleanup_timer.start(loop)
+    
+    def stop_cleanup(self):
+        """停止定时清理"""
+        self._cleanup_timer.stop()
     
     def _cleanup_idle_pools(self):
         """清理长时间未使用的连接池"""
-        while True:
-            time.sleep(300)  # 每5分钟检查一次
+        pools_to_close = []
+        
+        # 在锁内找出并移除超过10分钟未使用的连接池，请求线程取用连接池时也持有同一把锁
+        with self._lock:
             current_time = time.time()
-            pools_to_close = []
-            
-            # 找出超过10分钟未使用的连接池
-            for pool_key, pool_info in self._pools.items():
-                if current_time - pool_info["last_used"] > 600:  # 10分钟
-                    pools_to_close.append(pool_key)
-            
-            # 关闭并移除这些连接池
-            with self._lock:
-                for pool_key in pools_to_close:
-                    try:
-                        logger.info(f"关闭闲置PostgreSQL连接池: {pool_key}")
-                        self._pools[pool_key]["pool"].closeall()
-                        del self._pools[pool_key]
-                    except Exception as e:
-                        logger.error(f"关闭PostgreSQL连接池失败: {str(e)}")
+            for pool_key, last_used in list(self._last_used.items()):
+                # 仍有连接未归还的连接池(如长时间运行的查询)不关闭
+                if current_time - last_used > 600 and not self._checked_out.get(pool_key):  # 10分钟
+                    del self._last_used[pool_key]
+                    self._checked_out.pop(pool_key, None)
+                    pools_to_close.append((pool_key, self._pools.pop(pool_key)))
+        
+        # 在锁外关闭这些连接池
+        for pool_key, pool in pools_to_close:
+            try:
+                logger.info("关闭闲置PostgreSQL连接池: %s:%s/%s", *pool_key[:3])
+                pool.closeall()
+            except Exception as e:
+                logger.error("关闭PostgreSQL连接池失败: %s", e)
 
 
 class MongoDBConnectionPool:
     """MongoDB连接池管理器"""
     
     _instance = None
+    # _lock保护客户端字典和最后使用时间，_create_lock串行化客户端的创建，与PostgreSQLConnectionPool相同
     _lock = threading.Lock()
-    _clients: Dict[str, Dict[str, Any]] = {}
+    _create_lock = threading.Lock()
+    _clients: Dict[Tuple[str, int, str, Optional[str]], MongoClient] = {}
+    _last_used: Dict[Tuple[str, int, str, Optional[str]], float] = {}
     
     def __new__(cls):
         with cls._lock:
             if cls._instance is None:
                 cls._instance = super(MongoDBConnectionPool, cls).__new__(cls)
                 cls._instance._clients = {}
-                # 添加清理线程
-                cleanup_thread = threading.Thread(target=cls._instance._cleanup_idle_clients, daemon=True)
-                cleanup_thread.start()
+                cls._instance._last_used = {}
+                # 每5分钟检查一次闲置客户端，由应用启动时开始
+                cls._instance._cleanup_timer = _CleanupTimer(cls._instance._cleanup_idle_clients, 300)
             return cls._instance
     
     def get_client(self, host: str, port: int, database: str, 
@@ -125,19 +254,22 @@ class MongoDBConnectionPool:
                   auth_source: str = "admin", connect_timeout_ms: int = 30000) -> Tuple[Any, str]:
         """获取MongoDB客户端连接，如果不存在则创建新的客户端"""
         
-        client_key = f"{host}:{port}:{database}"
-        if username and password:
-            client_key += f":{username}"
+        client_key = (host, port, database, username if username and password else None)
+        
+        # 取客户端和更新最后使用时间在同一把锁内完成，清理线程不会关闭刚被取用的客户端
+        client = self._get_client(client_key)
         
-        # 检查客户端是否存在，不存在则创建
-        if client_key not in self._clients:
-            with self._lock:
-                if client_key not in self._clients:
+        # 客户端不存在则创建
+        if client is None:
+            with self._create_lock:
+                client = self._get_client(client_key)
+                if client is None:
                     try:
                         # 构建连接字符串
                         connection_string = f"mongodb://"
                         if username and password:
-                            connection_string += f"{username}:{password}@"
+                            # 用户名和密码中的@、:、/等特殊字符需要转义，否则连接字符串会被错误解析
+                            connection_string += f"{quote_plus(username)}:{quote_plus(password)}@"
                         connection_string += f"{host}:{port}/{database}"
                         if auth_source:
                             connection_string += f"?authSource={auth_source}"
@@ -153,46 +285,55 @@ class MongoDBConnectionPool:
                         }
                         
                         # 创建新的客户端
-                        logger.info(f"创建MongoDB客户端连接: {host}:{port}/{database}")
+                        logger.info("创建MongoDB客户端连接: %s:%s/%s", host, port, database)
                         client = pymongo.MongoClient(connection_string, **connect_options)
                         
                         # 测试连接
                         client.admin.command('ping')
-                        
-                        self._clients[client_key] = {
-                            "client": client,
-                            "last_used": time.time()
-                        }
                     except Exception as e:
-                        logger.error(f"创建MongoDB客户端连接失败: {str(e)}")
+                        logger.error("创建MongoDB客户端连接失败: %s", e)
                         return None, str(e)
+                    with self._lock:
+                        self._clients[client_key] = client
+                        self._last_used[client_key] = time.time()
         
-        # 更新最后使用时间
-        self._clients[client_key]["last_used"] = time.time()
-        
-        return self._clients[client_key]["client"], None
+        return client, None
+    
+    def _get_client(self, client_key: Tuple[str, int, str, Optional[str]]) -> Optional[MongoClient]:
+        """取出已有的客户端并更新最后使用时间，不存在时返回None"""
+        with self._lock:
+            client = self._clients.get(client_key)
+            if client is not None:
+                self._last_used[client_key] = time.time()
+            return client
+    
+    def start_cleanup(self, loop: asyncio.AbstractEventLoop):
+        """在事件循环上开始定时清理闲置客户端"""
+        self._cleanup_timer.start(loop)
+    
+    def stop_cleanup(self):
+        """停止定时清理"""
+        self._cleanup_timer.stop()
     
     def _cleanup_idle_clients(self):
         """清理长时间未使用的客户端连接"""
-        while True:
-            time.sleep(300)  # 每5分钟检查一次
+        clients_to_close = []
+        
+        # 在锁内找出并移除超过10分钟未使用的客户端，请求线程取用客户端时也持有同一把锁
+        with self._lock:
             current_time = time.time()
-            clients_to_close = []
-            
-            # 找出超过10分钟未使用的客户端
-            for client_key, client_info in self._clients.items():
-                if current_time - client_info["last_used"] > 600:  # 10分钟
-                    clients_to_close.append(client_key)
-            
-            # 关闭并移除这些客户端
-            with self._lock:
-                for client_key in clients_to_close:
-                    try:
-                        logger.info(f"关闭闲置MongoDB客户端: {client_key}")
-                        self._clients[client_key]["client"].close()
-                        del self._clients[client_key]
-                    except Exception as e:
-                        logger.error(f"关闭MongoDB客户端失败: {str(e)}")
+            for client_key, last_used in list(self._last_used.items()):
+                if current_time - last_used > 600:  # 10分钟
+                    del self._last_used[client_key]
+                    clients_to_close.append((client_key, self._clients.pop(client_key)))
+        
+        # 在锁外关闭这些客户端
+        for client_key, client in clients_to_close:
+            try:
+                logger.info("关闭闲置MongoDB客户端: %s:%s/%s", *client_key[:3])
+                client.close()
+            except Exception as e:
+                logger.error("关闭MongoDB客户端失败: %s", e)
 
 
 # 创建连接池单例实例
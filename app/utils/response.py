@@ -1,4 +1,33 @@
 from typing import Any, Optional, Dict, List, Union
+import orjson
+from fastapi.responses import ORJSONResponse
+
+def _json_default(value: Any) -> Any:
+    """
+    orjson不直接输出的类型
+    
+    日期/时间类型统一使用isoformat（orjson不支持带时区的time），
+    bytea转为PostgreSQL的十六进制文本格式，其他类型转为字符串（如Decimal）
+    """
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, (memoryview, bytes)):
+        return '\\x' + value.hex()
+    return str(value)
+
+def render_json(content: Any) -> bytes:
+    """按统一规则将内容序列化为JSON字节串"""
+    return orjson.dumps(content, default=_json_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+
+class APIResponse(ORJSONResponse):
+    """
+    统一格式的JSON响应
+    
+    直接使用orjson将响应字典序列化为字节，路由返回该对象时FastAPI不再经过jsonable_encoder
+    """
+    
+    def render(self, content: Any) -> bytes:
+        return render_json(content)
 
 def success_response(data: Union[List[Dict[str, Any]], int]) -> Dict[str, Any]:
     """
@@ -31,4 +60,21 @@ def error_response(error_code: int, error_message: str) -> Dict[str, Any]:
         "errCode": error_code,
         "data": None,
         "errMsg": error_message
-    } 
\ No newline at end of file
+    } 
+
+def prerendered_error_response(status_code: int, error_code: int, error_message: str) -> APIResponse:
+    """
+    预先渲染的固定错误响应
+    
+    Response对象只持有序列化后的字节，在模块加载时创建一次即可被多个请求复用，
+    用于错误码和错误信息都固定的场景
+    
+    Args:
+        status_code: HTTP状态码
+        error_code: 错误代码
+        error_message: 错误信息
+        
+    Returns:
+        可直接作为ASGI应用调用的响应对象
+    """
+    return APIResponse(status_code=status_code, content=error_response(error_code, error_message))
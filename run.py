@@ -1,4 +1,6 @@
+import os
 import uvicorn
 
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="0.0.0.0", port=3010, reload=True) 
\ No newline at end of file
+    # 安装了uvloop和httptools时uvicorn会自动使用；设置DEV环境变量时才开启代码热重载
+    uvicorn.run("app.main:app", host="0.0.0.0", port=3010, reload=bool(os.environ.get("DEV"))) 
\ No newline at end of file